@@ -1,5 +1,8 @@
 from flask import Flask, jsonify, request
 from datetime import datetime, timedelta
+from bisect import bisect_left, insort
+import heapq
+import ipaddress
 import secrets
 import threading
 
@@ -12,6 +15,16 @@ id_lock = threading.Lock()  # Add lock for thread-safe ID generation
 policies_lock = threading.Lock()  # Lock for policies dict
 active_tokens = {}
 tokens_lock = threading.Lock()  # Lock for tokens dict
+# Normalized match fields per policy, kept in sync on every write (guarded by policies_lock)
+policy_matches = {}
+policy_version = 0  # Bumped on every policy write
+analysis_cache = None  # Last analysis result, cleared on every policy write
+analysis_lock = threading.Lock()  # Lets only one analysis recompute run at a time
+
+ANY = 'any'
+ACTIONS = ('allow', 'deny')
+MATCH_FIELDS = ('port', 'source', 'destination', 'protocol')
+PROTOCOL_NUMBERS = {'icmp': 1, 'tcp': 6, 'udp': 17, 'ipv6-icmp': 58}
 
 def verify_token():
     """Verify the Authorization header contains valid token"""
@@ -30,6 +43,270 @@ def verify_token():
                 del active_tokens[token]
     return False
 
+def is_any(value):
+    return value is None or (isinstance(value, str) and value.strip().lower() == ANY)
+
+def parse_ports(value):
+    """Parse a port field (int, 'lo-hi' string, [lo, hi] or 'any') into an inclusive range"""
+    if is_any(value):
+        return (0, 65535)
+    if isinstance(value, bool):
+        raise ValueError(f"invalid port: {value!r}")
+    if isinstance(value, int):
+        lo = hi = value
+    elif isinstance(value, str):
+        lo, _, hi = value.partition('-')
+        lo = int(lo)
+        hi = int(hi) if hi else lo
+    elif isinstance(value, (list, tuple)) and len(value) == 2:
+        lo, hi = int(value[0]), int(value[1])
+    else:
+        raise ValueError(f"invalid port: {value!r}")
+    if not 0 <= lo <= hi <= 65535:
+        raise ValueError(f"invalid port: {value!r}")
+    return (lo, hi)
+
+def parse_address(value):
+    """Parse an address field into (version, first, prefixlen), or ANY for all addresses"""
+    if is_any(value):
+        return ANY
+    network = ipaddress.ip_network(value.strip() if isinstance(value, str) else value, strict=False)
+    return (network.version, int(network.network_address), network.prefixlen)
+
+def parse_protocol(value):
+    """Parse a protocol field into an IP protocol number (or unknown lowercase name), or ANY"""
+    if is_any(value):
+        return ANY
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if not value.isdigit():
+            return PROTOCOL_NUMBERS.get(value, value)
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 255:
+        return value
+    raise ValueError(f"invalid protocol: {value!r}")
+
+def parse_action(value):
+    """Parse an action field into one of ACTIONS"""
+    action = value.strip().lower() if isinstance(value, str) else None
+    if action not in ACTIONS:
+        raise ValueError(f"invalid action: {value!r}")
+    return action
+
+def host_bits(address):
+    """Number of host bits in an address prefix"""
+    return (32 if address[0] == 4 else 128) - address[2]
+
+def address_covers(outer, inner):
+    """Check whether address outer contains every address in inner"""
+    if outer == ANY:
+        return True
+    if inner == ANY or outer[0] != inner[0] or outer[2] > inner[2]:
+        return False
+    shift = host_bits(outer)
+    return inner[1] >> shift == outer[1] >> shift
+
+def normalize_policy(policy):
+    """Extract the match fields of a policy, or None if they cannot be parsed"""
+    try:
+        return {
+            'id': policy['id'],
+            'action': parse_action(policy.get('action')),
+            'ports': parse_ports(policy.get('port')),
+            'source': parse_address(policy.get('source')),
+            'destination': parse_address(policy.get('destination')),
+            'protocol': parse_protocol(policy.get('protocol')),
+            # Omitted match fields mean 'any', which is worth surfacing separately
+            'implicit_any': any(field not in policy for field in MATCH_FIELDS),
+        }
+    except (TypeError, ValueError):
+        return None
+
+def sync_policy_matches(policy_id):
+    """Refresh the normalized entry for one policy and invalidate the cached analysis"""
+    global analysis_cache, policy_version
+    if policy_id in policies:
+        policy_matches[policy_id] = normalize_policy(policies[policy_id])
+    else:
+        policy_matches.pop(policy_id, None)
+    policy_version += 1
+    analysis_cache = None
+
+class PrefixIndex:
+    """Values keyed by address prefix, looked up by containment in either direction"""
+
+    def __init__(self):
+        self.buckets = {}  # address -> value, for ANY and supernet lookups
+        self.ordered = []  # sorted non-ANY addresses, for subnet range scans
+        self.lengths = {}  # version -> {prefixlen: bucket count}, so supernet probes skip unused lengths
+
+    def __bool__(self):
+        return bool(self.buckets)
+
+    def setdefault(self, address, factory):
+        if address not in self.buckets:
+            self.buckets[address] = factory()
+            if address != ANY:
+                insort(self.ordered, address)
+                counts = self.lengths.setdefault(address[0], {})
+                counts[address[2]] = counts.get(address[2], 0) + 1
+        return self.buckets[address]
+
+    def get(self, address):
+        return self.buckets[address]
+
+    def pop(self, address):
+        if address != ANY:
+            del self.ordered[bisect_left(self.ordered, address)]
+            counts = self.lengths[address[0]]
+            counts[address[2]] -= 1
+            if not counts[address[2]]:
+                del counts[address[2]]
+        return self.buckets.pop(address)
+
+    def supernets(self, address):
+        """Yield the values of every prefix containing address, including address itself"""
+        if ANY in self.buckets:
+            yield self.buckets[ANY]
+        if address == ANY:
+            return
+        version, first, prefixlen = address
+        max_len = 32 if version == 4 else 128
+        for length in self.lengths.get(version, ()):
+            if length <= prefixlen:
+                shift = max_len - length
+                key = (version, (first >> shift) << shift, length)
+                if key in self.buckets:
+                    yield self.buckets[key]
+
+    def subnet_range(self, address):
+        """Return the slice of ordered holding every prefix strictly inside address"""
+        if address == ANY:
+            return 0, len(self.ordered)
+        version, first, prefixlen = address
+        last = first + (1 << host_bits(address)) - 1
+        # CIDR blocks nest, so every longer prefix starting inside this block lies inside it
+        return (bisect_left(self.ordered, (version, first, prefixlen + 1)),
+                bisect_left(self.ordered, (version, last + 1)))
+
+    def subnets(self, address):
+        """Yield the values of every prefix strictly inside address"""
+        lo, hi = self.subnet_range(address)
+        for i in range(lo, hi):
+            yield self.buckets[self.ordered[i]]
+
+    def overlapping(self, address):
+        """Yield the values of every prefix that overlaps address"""
+        yield from self.supernets(address)
+        yield from self.subnets(address)
+
+class ActiveRuleIndex:
+    """Rules currently open in the port sweep, bucketed by protocol, source and destination
+
+    Each rule is stored twice, once source-major and once destination-major, so
+    a lookup can reach overlapping rules through whichever field is cheaper.
+    """
+
+    FIELD_ORDERS = (('source', 'destination'), ('destination', 'source'))
+
+    def __init__(self):
+        self.by_protocol = {}  # protocol -> one nested PrefixIndex per field order
+
+    def add(self, rule):
+        indexes = self.by_protocol.setdefault(rule['protocol'], [PrefixIndex() for _ in self.FIELD_ORDERS])
+        for index, (outer, inner) in zip(indexes, self.FIELD_ORDERS):
+            ids = index.setdefault(rule[outer], PrefixIndex).setdefault(rule[inner], set)
+            ids.add(rule['id'])
+
+    def remove(self, rule):
+        indexes = self.by_protocol[rule['protocol']]
+        for index, (outer, inner) in zip(indexes, self.FIELD_ORDERS):
+            inner_index = index.get(rule[outer])
+            ids = inner_index.get(rule[inner])
+            ids.discard(rule['id'])
+            if not ids:
+                inner_index.pop(rule[inner])
+                if not inner_index:
+                    index.pop(rule[outer])
+        if not indexes[0]:
+            del self.by_protocol[rule['protocol']]
+
+    def overlapping(self, rule):
+        """Yield ids of active rules that overlap the rule in protocol, source and destination"""
+        if rule['protocol'] == ANY:
+            protocols = list(self.by_protocol)
+        else:
+            protocols = [p for p in (rule['protocol'], ANY) if p in self.by_protocol]
+        source, destination = rule['source'], rule['destination']
+        for protocol in protocols:
+            by_source, by_destination = self.by_protocol[protocol]
+            # Source contains the rule's source: any overlapping destination
+            for inner_index in by_source.supernets(source):
+                for ids in inner_index.overlapping(destination):
+                    yield from ids
+            # Source strictly inside, destination contains the rule's destination
+            for inner_index in by_destination.supernets(destination):
+                for ids in inner_index.subnets(source):
+                    yield from ids
+            # Both strictly inside: walk whichever outer range holds fewer buckets
+            source_lo, source_hi = by_source.subnet_range(source)
+            destination_lo, destination_hi = by_destination.subnet_range(destination)
+            if source_hi - source_lo <= destination_hi - destination_lo:
+                outer_index, outer, inner = by_source, source, destination
+            else:
+                outer_index, outer, inner = by_destination, destination, source
+            for inner_index in outer_index.subnets(outer):
+                for ids in inner_index.subnets(inner):
+                    yield from ids
+
+def analyze_policies(rules):
+    """Find shadowed, redundant and conflicting rules, evaluating rules in ID order
+
+    Rules are swept by port range start; each rule is only compared with rules
+    whose port ranges are still open and that share a protocol bucket and
+    overlapping source and destination prefixes. A shadowed or redundant rule
+    is reported once, against the lowest-id rule that covers it.
+    """
+    by_id = {rule['id']: rule for rule in rules}
+    covered_by = {}  # later id -> lowest earlier id covering it
+    conflicts = []
+    active = ActiveRuleIndex()
+    open_rules = []  # heap of (port_hi, id) for rules still open in the sweep
+
+    for rule in sorted(rules, key=lambda r: (r['ports'][0], r['id'])):
+        while open_rules and open_rules[0][0] < rule['ports'][0]:
+            _, expired_id = heapq.heappop(open_rules)
+            active.remove(by_id[expired_id])
+
+        for other_id in active.overlapping(rule):
+            other = by_id[other_id]
+            earlier, later = (other, rule) if other['id'] < rule['id'] else (rule, other)
+            covers = (
+                earlier['ports'][0] <= later['ports'][0]
+                and later['ports'][1] <= earlier['ports'][1]
+                and address_covers(earlier['source'], later['source'])
+                and address_covers(earlier['destination'], later['destination'])
+                and earlier['protocol'] in (ANY, later['protocol'])
+            )
+            if covers:
+                if earlier['id'] < covered_by.get(later['id'], later['id']):
+                    covered_by[later['id']] = earlier['id']
+            elif earlier['action'] != later['action']:
+                conflicts.append({'policy_id': later['id'], 'conflicts_with': earlier['id']})
+
+        active.add(rule)
+        heapq.heappush(open_rules, (rule['ports'][1], rule['id']))
+
+    shadowed, redundant = [], []
+    for later_id, earlier_id in sorted(covered_by.items()):
+        same_action = by_id[later_id]['action'] == by_id[earlier_id]['action']
+        (redundant if same_action else shadowed).append({'policy_id': later_id, 'covered_by': earlier_id})
+    return {
+        'shadowed': shadowed,
+        'redundant': redundant,
+        'conflicts': sorted(conflicts, key=lambda f: (f['policy_id'], f['conflicts_with'])),
+    }
+
 @app.route('/api/authenticate', methods=['POST'])
 def authenticate():
     data = request.json
@@ -51,6 +328,38 @@ def get_policies():
     with policies_lock:
         return jsonify(list(policies.values())), 200
 
+@app.route('/api/policies/analysis', methods=['GET'])
+def get_policy_analysis():
+    global analysis_cache
+    if not verify_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    with policies_lock:
+        # Cached until the next create/update/delete
+        if analysis_cache is not None:
+            return jsonify(analysis_cache), 200
+
+    # Readers that miss the cache queue here and reuse the first one's result
+    with analysis_lock:
+        with policies_lock:
+            if analysis_cache is not None:
+                return jsonify(analysis_cache), 200
+            version = policy_version
+            matches = dict(policy_matches)
+
+        # Run the sweep outside policies_lock so writes are not blocked by a cold read
+        rules = [rule for rule in matches.values() if rule is not None]
+        result = {
+            'policy_count': len(matches),
+            **analyze_policies(rules),
+            'unparsed': sorted(pid for pid, rule in matches.items() if rule is None),
+            'implicit_any': sorted(rule['id'] for rule in rules if rule['implicit_any']),
+        }
+        with policies_lock:
+            if policy_version == version:
+                analysis_cache = result
+    return jsonify(result), 200
+
 @app.route('/api/policies', methods=['POST'])
 def create_policy():
     global next_policy_id
@@ -69,6 +378,7 @@ def create_policy():
     
     with policies_lock:
         policies[policy_id] = policy
+        sync_policy_matches(policy_id)
     
     return jsonify(policy), 201
 
@@ -95,6 +405,7 @@ def update_policy(policy_id):
         # Update existing policy, preserve ID
         policies[policy_id].update(data)
         policies[policy_id]['id'] = policy_id
+        sync_policy_matches(policy_id)
         return jsonify(policies[policy_id]), 200
 
 @app.route('/api/policies/<int:policy_id>', methods=['DELETE'])
@@ -106,6 +417,7 @@ def delete_policy(policy_id):
         if policy_id not in policies:
             return jsonify({'error': 'Not Found'}), 404
         del policies[policy_id]
+        sync_policy_matches(policy_id)
     
     return jsonify({'message': 'Deleted'}), 204
 
@@ -0,0 +1,200 @@
+import pytest
+from src.api_client import ApiClient
+from src.mock_firewall_api import PrefixIndex, analyze_policies, normalize_policy
+
+@pytest.fixture
+def api_client():
+    """Provides authenticated API client"""
+    client = ApiClient(base_url="http://localhost:5000")
+    client.authenticate(username="admin", password="password")
+    return client
+
+@pytest.fixture
+def create_policy(api_client):
+    """Creates policies on demand and deletes them after the test"""
+    created_ids = []
+
+    def _create(**fields):
+        response = api_client.post("/api/policies", json={"name": "Analysis Policy", **fields})
+        assert response.status_code == 201
+        created_ids.append(response.json()['id'])
+        return response.json()['id']
+
+    yield _create
+    for policy_id in created_ids:
+        api_client.delete(f"/api/policies/{policy_id}")
+
+def get_analysis(api_client):
+    response = api_client.get("/api/policies/analysis")
+    assert response.status_code == 200
+    return response.json()
+
+def reported_pairs(analysis):
+    """Flatten findings into (later_id, earlier_id) pairs"""
+    pairs = {(f["policy_id"], f["covered_by"]) for key in ("shadowed", "redundant") for f in analysis[key]}
+    return pairs | {(f["policy_id"], f["conflicts_with"]) for f in analysis["conflicts"]}
+
+# Tests
+def test_analysis_requires_authentication():
+    """Test that the analysis endpoint rejects unauthenticated requests"""
+    client = ApiClient(base_url="http://localhost:5000")
+    response = client.get("/api/policies/analysis")
+    assert response.status_code == 401
+
+def test_analysis_detects_shadowed_policy(api_client, create_policy):
+    """A later rule fully covered by an earlier rule with the opposite action is shadowed"""
+    broad_id = create_policy(port="1000-2000", action="deny", source="172.16.0.0/16", destination="any")
+    narrow_id = create_policy(port=1500, action="allow", source="172.16.5.0/24", destination="192.168.1.0/24")
+
+    analysis = get_analysis(api_client)
+    assert {"policy_id": narrow_id, "covered_by": broad_id} in analysis["shadowed"]
+    assert all(f["policy_id"] != narrow_id for f in analysis["redundant"])
+
+def test_analysis_detects_redundant_policy(api_client, create_policy):
+    """A later rule fully covered by an earlier rule with the same action is redundant"""
+    broad_id = create_policy(port="any", action="allow", source="172.17.0.0/16", destination="any")
+    narrow_id = create_policy(port=22, action="allow", source="172.17.3.4", destination="any")
+
+    analysis = get_analysis(api_client)
+    assert {"policy_id": narrow_id, "covered_by": broad_id} in analysis["redundant"]
+    assert all(f["policy_id"] != narrow_id for f in analysis["shadowed"])
+
+def test_analysis_detects_conflicting_policies(api_client, create_policy):
+    """Partially overlapping rules with opposite actions conflict"""
+    first_id = create_policy(port="3000-3100", action="allow", source="172.18.1.0/24", destination="any")
+    second_id = create_policy(port="3050-3200", action="deny", source="172.18.0.0/16", destination="any")
+
+    analysis = get_analysis(api_client)
+    assert {"policy_id": second_id, "conflicts_with": first_id} in analysis["conflicts"]
+
+def test_analysis_ignores_disjoint_policies(api_client, create_policy):
+    """Rules that cannot match the same traffic are not reported"""
+    first_id = create_policy(port=4000, action="allow", source="172.19.1.0/24", destination="any")
+    second_id = create_policy(port=4000, action="deny", source="172.19.2.0/24", destination="any")
+    third_id = create_policy(port=4001, action="deny", source="172.19.1.0/24", destination="any")
+
+    # Only check pairs among these rules; policies left behind by other tests may overlap them
+    pairs = reported_pairs(get_analysis(api_client))
+    assert not pairs & {(second_id, first_id), (third_id, first_id), (third_id, second_id)}
+
+def test_analysis_separates_protocols(api_client, create_policy):
+    """Rules for different protocols never overlap, but protocol 'any' covers both"""
+    tcp_id = create_policy(port=6000, action="allow", protocol="tcp", source="172.20.0.0/16", destination="any")
+    udp_id = create_policy(port=6000, action="deny", protocol="udp", source="172.20.0.0/16", destination="any")
+    any_id = create_policy(port=6000, action="deny", protocol="ANY", source="172.20.1.0/24", destination="any")
+
+    analysis = get_analysis(api_client)
+    assert (udp_id, tcp_id) not in reported_pairs(analysis)
+    assert {"policy_id": any_id, "conflicts_with": tcp_id} in analysis["conflicts"]
+
+def test_analysis_keeps_ip_versions_apart(api_client, create_policy):
+    """IPv6 prefixes are only compared with IPv6 prefixes"""
+    v6_broad_id = create_policy(port=6100, action="deny", source="2001:db8::/32", destination="any")
+    v6_narrow_id = create_policy(port=6100, action="allow", source="2001:db8:1::/48", destination="any")
+    v4_id = create_policy(port=6100, action="allow", source="0.0.0.0/0", destination="any")
+
+    analysis = get_analysis(api_client)
+    assert {"policy_id": v6_narrow_id, "covered_by": v6_broad_id} in analysis["shadowed"]
+    assert not reported_pairs(analysis) & {(v4_id, v6_broad_id), (v4_id, v6_narrow_id)}
+
+def test_analysis_refreshes_after_update(api_client, create_policy):
+    """Cached analysis is recomputed after a policy changes"""
+    broad_id = create_policy(port="5000-6000", action="deny", source="any", destination="10.20.0.0/16")
+    narrow_id = create_policy(port=5500, action="allow", source="any", destination="10.20.30.0/24")
+    assert {"policy_id": narrow_id, "covered_by": broad_id} in get_analysis(api_client)["shadowed"]
+
+    update_response = api_client.put(f"/api/policies/{narrow_id}", json={"action": "deny"})
+    assert update_response.status_code == 200
+
+    analysis = get_analysis(api_client)
+    assert {"policy_id": narrow_id, "covered_by": broad_id} not in analysis["shadowed"]
+    assert {"policy_id": narrow_id, "covered_by": broad_id} in analysis["redundant"]
+
+def test_analysis_refreshes_after_delete(api_client, create_policy):
+    """Cached analysis is recomputed after a policy is deleted"""
+    broad_id = create_policy(port="7000-8000", action="deny", source="any", destination="10.21.0.0/16")
+    narrow_id = create_policy(port=7500, action="allow", source="any", destination="10.21.30.0/24")
+    assert {"policy_id": narrow_id, "covered_by": broad_id} in get_analysis(api_client)["shadowed"]
+
+    delete_response = api_client.delete(f"/api/policies/{broad_id}")
+    assert delete_response.status_code == 204
+
+    assert (narrow_id, broad_id) not in reported_pairs(get_analysis(api_client))
+
+def test_analysis_reports_unparsed_policies(api_client, create_policy):
+    """Policies with unparseable match fields are listed instead of analyzed"""
+    policy_id = create_policy(port="not-a-port", action="allow", source="10.0.0.0/8")
+
+    analysis = get_analysis(api_client)
+    assert policy_id in analysis["unparsed"]
+
+def test_analysis_reports_first_covering_policy_only(api_client, create_policy):
+    """A rule covered by several earlier rules is reported once, against the first of them"""
+    first_id = create_policy(port="any", action="deny", source="172.22.0.0/16", destination="any")
+    second_id = create_policy(port="any", action="allow", source="172.22.0.0/16", destination="any")
+    third_id = create_policy(port=443, action="allow", source="172.22.9.0/24", destination="any")
+
+    analysis = get_analysis(api_client)
+    findings = [f for key in ("shadowed", "redundant") for f in analysis[key] if f["policy_id"] == third_id]
+    assert findings == [{"policy_id": third_id, "covered_by": first_id}]
+    assert {"policy_id": second_id, "covered_by": first_id} in analysis["shadowed"]
+    assert findings[0] in analysis["shadowed"]
+
+def test_analysis_normalizes_action_case(api_client, create_policy):
+    """Actions are compared case-insensitively"""
+    broad_id = create_policy(port="any", action="allow", source="172.23.0.0/16", destination="any")
+    narrow_id = create_policy(port=80, action=" Allow", source="172.23.1.0/24", destination="any")
+
+    analysis = get_analysis(api_client)
+    assert {"policy_id": narrow_id, "covered_by": broad_id} in analysis["redundant"]
+    assert all(f["policy_id"] != narrow_id for f in analysis["shadowed"])
+
+def test_analysis_reports_implicit_any_policies(api_client, create_policy):
+    """Policies that omit a match field are listed because the field defaults to 'any'"""
+    implicit_id = create_policy(port=8443, action="allow", source="172.24.0.0/16")
+    explicit_id = create_policy(port=8443, action="allow", source="172.24.0.0/16", destination="any", protocol="any")
+
+    analysis = get_analysis(api_client)
+    assert implicit_id in analysis["implicit_any"]
+    assert explicit_id not in analysis["implicit_any"]
+
+def host_and_broad_rules(hosts, broad_source, broad_destinations):
+    """Host-to-host rules plus broad rules whose destinations miss every host"""
+    rules = [{"source": source, "destination": destination} for source, destination in hosts]
+    rules += [{"source": broad_source, "destination": destination} for destination in broad_destinations]
+    return rules
+
+SCALING_SHAPES = {
+    "any_source": [{"source": "any", "destination": f"10.{i // 256}.{i % 256}.0/24"} for i in range(2000)],
+    "any_destination": [{"source": f"10.{i // 256}.{i % 256}.0/24", "destination": "any"} for i in range(2000)],
+    "ipv4_hosts_under_broad_prefix": host_and_broad_rules(
+        [(f"10.0.{i // 256}.{i % 256}/32", f"21.0.{i // 256}.{i % 256}/32") for i in range(1000)],
+        "10.0.0.0/16",
+        [f"{40 + i // 256}.{i % 256}.0.0/16" for i in range(1000)],
+    ),
+    "ipv6_hosts_under_broad_prefix": host_and_broad_rules(
+        [(f"2001:db8::{i:x}/128", f"2001:db9::{i:x}/128") for i in range(1000)],
+        "2001:db8::/32",
+        [f"2001:{0xa00 + i:x}::/32" for i in range(1000)],
+    ),
+}
+
+@pytest.mark.parametrize("shape", sorted(SCALING_SHAPES))
+def test_analysis_scales_with_disjoint_prefixes(monkeypatch, shape):
+    """Rules that never overlap must not be walked pairwise by the sweep"""
+    # Count every prefix bucket the sweep visits; a pairwise walk visits on the order of n^2
+    visits = []
+    for name in ("supernets", "subnets"):
+        def counted(self, address, _original=getattr(PrefixIndex, name)):
+            for value in _original(self, address):
+                visits.append(1)
+                yield value
+        monkeypatch.setattr(PrefixIndex, name, counted)
+
+    rules = [
+        normalize_policy({"id": i, "port": "any", "action": "allow", "protocol": "tcp", **fields})
+        for i, fields in enumerate(SCALING_SHAPES[shape], start=1)
+    ]
+    analysis = analyze_policies(rules)
+    assert analysis == {"shadowed": [], "redundant": [], "conflicts": []}
+    assert len(visits) <= 4 * len(rules)